@@ -1,9 +1,18 @@
 import streamlit as st
 import pandas as pd
-import json
+import numpy as np
+import functools
 import glob
+import os
+import requests
+from requests.adapters import HTTPAdapter, Retry
 from datetime import datetime
 
+try:  # orjson parses the numeric-heavy snapshots several times faster
+    import orjson as _json
+except ImportError:
+    import json as _json
+
 # -------------------
 # CONFIG
 # -------------------
@@ -12,74 +21,259 @@ SNAPSHOT_DEFAULT_SEASON = 2025
 NCAA_SEASON_START_MM_DD = "11-01"
 NCAA_SEASON_END_MM_DD = "04-15"
 ROUND_POINTS = {1: 1, 2: 2, 3: 4, 4: 8, 5: 16, 6: 32}
+WHATIF_SCHEMA = {"matchup_id": "string[pyarrow]", "winner_id": "string[pyarrow]", "round": "int8"}
+
+# ROUND_POINTS as a positional array so scoring can index instead of dict-lookup
+_ROUND_PTS = np.zeros(max(ROUND_POINTS) + 1, dtype=np.int8)
+for _rnd, _pts in ROUND_POINTS.items():
+    _ROUND_PTS[_rnd] = _pts
+ODDS_API_URL = "https://api.the-odds-api.com/v4/sports/basketball_ncaab/odds"
+RATINGS_CSV = "m_ratings.csv"
+HOME_COURT_ELO = 50
 
 # -------------------
 # HELPERS
 # -------------------
+_SEASON_START_MD = tuple(int(x) for x in NCAA_SEASON_START_MM_DD.split("-"))
+_SEASON_END_MD = tuple(int(x) for x in NCAA_SEASON_END_MM_DD.split("-"))
+
+@functools.lru_cache(maxsize=8)
+def _in_season_for_ordinal(ordinal):
+    today = datetime.fromordinal(ordinal)
+    md = (today.month, today.day)
+    # season wraps New Year: Nov 1 through Apr 15
+    return md >= _SEASON_START_MD or md <= _SEASON_END_MD
+
 def is_ncaa_in_season(today=None):
     today = today or datetime.today()
-    y = today.year
-    start = datetime.strptime(f"{y}-{NCAA_SEASON_START_MM_DD}", "%Y-%m-%d")
-    if today.month >= 11:
-        end = datetime.strptime(f"{y+1}-{NCAA_SEASON_END_MM_DD}", "%Y-%m-%d")
-    else:
-        end = datetime.strptime(f"{y}-{NCAA_SEASON_END_MM_DD}", "%Y-%m-%d")
-    return start <= today <= end
+    return _in_season_for_ordinal(today.toordinal())
 
+@st.cache_data(ttl=30, show_spinner=False)
 def get_latest_snapshot_path():
-    files = sorted(glob.glob(f"{SNAPSHOT_DIR}/*_selection_sunday.json"))
+    files = glob.glob(f"{SNAPSHOT_DIR}/*_selection_sunday.json")
     if files:
-        return files[-1]
+        return max(files, key=os.path.getmtime)
     return f"{SNAPSHOT_DIR}/{SNAPSHOT_DEFAULT_SEASON}_selection_sunday.json"
 
-def load_snapshot(path: str):
-    with open(path, "r") as f:
-        data = json.load(f)
-    teams_df = pd.DataFrame(data.get("teams", []))
-    bracket_df = pd.DataFrame(data.get("bracket", []))
-    odds_df = pd.DataFrame(data.get("odds", []))
-    results_df = pd.DataFrame(data.get("results", []))
+@st.cache_data(show_spinner=False)
+def _load_snapshot_cached(path: str, mtime: float):
+    with open(path, "rb") as f:
+        data = _json.loads(f.read())
+    teams_df = pd.DataFrame.from_records(data.get("teams", [])).convert_dtypes(dtype_backend="pyarrow")
+    bracket_df = pd.DataFrame.from_records(data.get("bracket", [])).convert_dtypes(dtype_backend="pyarrow")
+    odds_df = pd.DataFrame.from_records(data.get("odds", [])).convert_dtypes(dtype_backend="pyarrow")
+    results_df = pd.DataFrame.from_records(data.get("results", [])).convert_dtypes(dtype_backend="pyarrow")
+    id_cols = ("matchup_id", "team_id", "team1_id", "team2_id", "winner_id", "predicted_winner")
+    for df in (teams_df, bracket_df, odds_df, results_df):
+        for col in id_cols:
+            if col in df.columns:
+                df[col] = df[col].astype("category")
+        if "round" in df.columns:
+            df["round"] = df["round"].astype("int8")
     return data.get("meta", {}), teams_df, bracket_df, odds_df, results_df
 
+def load_snapshot(path: str):
+    # mtime participates in the cache key so a refreshed snapshot file
+    # invalidates the parsed frames automatically
+    return _load_snapshot_cached(path, os.path.getmtime(path))
+
 def snapshot_picks_to_brackets(bracket_df: pd.DataFrame):
     pick_cols = ["kenpom_winner", "torvik_winner", "espn_consensus_winner", "cbs_consensus_winner"]
-    out = {"m_rating": {}}
-    for _, row in bracket_df.iterrows():
-        mid = row["matchup_id"]
-        out["m_rating"][mid] = row.get("predicted_winner")
-        for col in pick_cols:
-            if col in bracket_df.columns:
-                out.setdefault(col.replace("_winner", ""), {})[mid] = row.get(col)
+    if bracket_df.empty:
+        return {"m_rating": {}}
+    mids = bracket_df["matchup_id"].to_numpy()
+    out = {"m_rating": dict(zip(mids, bracket_df["predicted_winner"].to_numpy()))}
+    for col in pick_cols:
+        if col in bracket_df.columns:
+            out[col.replace("_winner", "")] = dict(zip(mids, bracket_df[col].to_numpy()))
     return out
 
+def matchup_labels(subset: pd.DataFrame, id_to_name: dict):
+    return {
+        row.matchup_id: f"{row.matchup_id}: {id_to_name.get(row.team1_id, row.team1_id)}"
+                        f" vs {id_to_name.get(row.team2_id, row.team2_id)}"
+        for row in subset.itertuples(index=False)
+    }
+
 def score_brackets(picks: dict, results_df: pd.DataFrame):
-    results = {r["matchup_id"]: r["winner_id"] for _, r in results_df.iterrows()} if not results_df.empty else {}
-    rounds = {r["matchup_id"]: int(r["round"]) for _, r in results_df.iterrows()} if not results_df.empty else {}
-    rows = []
-    for name, bracket in picks.items():
-        score = 0
-        max_possible = 0
-        for mid, picked in bracket.items():
-            rnd = rounds.get(mid)
-            if rnd is None:
-                continue
-            pts = ROUND_POINTS.get(rnd, 0)
-            max_possible += pts
-            actual = results.get(mid)
-            if actual is not None and picked == actual:
-                score += pts
-        rows.append({"bracket": name, "score": score, "max_possible": max_possible})
-    return pd.DataFrame(rows).sort_values(["score", "max_possible"], ascending=[False, False])
-
-def current_results(results_df: pd.DataFrame):
-    base = results_df.copy()
-    overrides = st.session_state.whatif_results.copy()
+    names = list(picks)
+    zeros = pd.DataFrame({"bracket": names, "score": 0, "max_possible": 0})
+    if results_df.empty:
+        return zeros
+    picks_long = pd.DataFrame(
+        [(name, mid, picked) for name, bracket in picks.items() for mid, picked in bracket.items()],
+        columns=["bracket", "matchup_id", "picked"],
+    )
+    merged = picks_long.merge(results_df[["matchup_id", "winner_id", "round"]], on="matchup_id", how="inner")
+    rnds = merged["round"].to_numpy(dtype=np.intp)
+    in_range = (rnds >= 0) & (rnds < len(_ROUND_PTS))
+    merged["pts"] = np.where(in_range, _ROUND_PTS[np.clip(rnds, 0, len(_ROUND_PTS) - 1)], 0).astype("int32")
+    merged["got"] = np.where(merged["picked"].to_numpy() == merged["winner_id"].to_numpy(), merged["pts"], 0)
+    out = (
+        merged.groupby("bracket", sort=False)
+        .agg(score=("got", "sum"), max_possible=("pts", "sum"))
+        .reset_index()
+    )
+    scored = set(out["bracket"])
+    if len(scored) < len(names):
+        out = pd.concat([out, zeros[~zeros["bracket"].isin(scored)]], ignore_index=True)
+    return out.sort_values(["score", "max_possible"], ascending=[False, False])
+
+def current_results(results_df: pd.DataFrame, overrides: pd.DataFrame):
+    base = results_df
     if overrides.empty:
         return base
-    if not base.empty:
-        base = base[~base["matchup_id"].isin(overrides["matchup_id"])]
-    merged = pd.concat([base, overrides], ignore_index=True)
-    return merged
+    if base.empty:
+        return overrides
+    return (
+        overrides.set_index("matchup_id")
+        .combine_first(base.set_index("matchup_id"))
+        .reset_index()
+    )
+
+@st.cache_data(show_spinner=False)
+def _for_display(df: pd.DataFrame):
+    # cut Arrow serialization cost: repeated strings -> category, float64 -> float32
+    if df.empty:
+        return df
+    casts = {c: "category" for c in df.select_dtypes("object").columns}
+    casts.update({c: "float32" for c in df.select_dtypes("float64").columns})
+    return df.astype(casts) if casts else df
+
+@st.cache_data(show_spinner=False)
+def score_snapshot_brackets(snap_path: str, mtime: float, overrides_tuple: tuple):
+    _meta, _teams_df, bracket_df, _odds_df, results_df = _load_snapshot_cached(snap_path, mtime)
+    overrides = pd.DataFrame(list(overrides_tuple), columns=list(WHATIF_SCHEMA)).astype(WHATIF_SCHEMA)
+    picks = snapshot_picks_to_brackets(bracket_df)
+    return score_brackets(picks, current_results(results_df, overrides))
+
+# -------------------
+# LIVE MODE
+# -------------------
+# One pooled session per process: reruns reuse the TCP+TLS connection to
+# the Odds API instead of re-handshaking, and transient 429/5xx get retried.
+_session = requests.Session()
+_session.mount(
+    "https://",
+    HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])),
+)
+
+@st.cache_data(show_spinner=False)
+def load_ratings():
+    try:
+        ratings = pd.read_csv(RATINGS_CSV)
+    except FileNotFoundError:
+        ratings = pd.DataFrame(columns=["team", "elo"])
+    return ratings.astype({"team": "category", "elo": "int16"})
+
+def american_to_prob(prices):
+    prices = np.asarray(prices, dtype=np.float64)
+    return np.where(prices > 0, 100.0 / (prices + 100.0), -prices / (-prices + 100.0))
+
+def implied_from_book(event):
+    for book in event.get("bookmakers", []):
+        for market in book.get("markets", []):
+            if market.get("key") != "h2h":
+                continue
+            prices = {o["name"]: o["price"] for o in market.get("outcomes", [])}
+            if event["home_team"] not in prices or event["away_team"] not in prices:
+                continue
+            implied = american_to_prob([prices[event["home_team"]], prices[event["away_team"]]])
+            home, away = implied / implied.sum()
+            return float(home), float(away)
+    return None
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_market_odds_ncaab(api_key: str):
+    params = {"apiKey": api_key, "regions": "us", "markets": "h2h", "oddsFormat": "american"}
+    r = _session.get(ODDS_API_URL, params=params, timeout=(3.05, 15))
+    r.raise_for_status()
+    odds_map = {}
+    for event in r.json():
+        implied = implied_from_book(event)
+        if implied is None:
+            continue
+        home_prob, away_prob = implied
+        matchup = f'{event["away_team"]} @ {event["home_team"]}'
+        odds_map[matchup] = {
+            "away": event["away_team"],
+            "home": event["home_team"],
+            "market_home": home_prob,
+            "market_away": away_prob,
+        }
+    return odds_map
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_todays_games(api_key: str):
+    odds_map = get_market_odds_ncaab(api_key)
+    return [(o["away"], o["home"]) for o in odds_map.values()]
+
+def predict_win_prob(away, home, elo_map: pd.Series):
+    # elo_map is ratings_df.set_index("team")["elo"] built once by the caller:
+    # hash lookups here instead of a boolean scan over the ratings per team
+    elo_a = float(elo_map.get(away, 1500.0))
+    elo_h = float(elo_map.get(home, 1500.0)) + HOME_COURT_ELO
+    return 1.0 / (1.0 + 10 ** ((elo_a - elo_h) / 400.0))
+
+# 10**x is exp(x*ln10); the exp form lets numba's fastmath vectorize the loop.
+_LN10_OVER_400 = np.log(10.0) / 400.0
+
+def _elo_win_prob_np(elo_a, elo_h):
+    return 1.0 / (1.0 + np.exp((elo_a - elo_h) * _LN10_OVER_400))
+
+try:
+    from numba import njit
+
+    @njit(cache=True, fastmath=True)
+    def elo_win_prob(elo_a, elo_h):
+        out = np.empty(elo_a.shape[0], np.float64)
+        for i in range(elo_a.shape[0]):
+            out[i] = 1.0 / (1.0 + np.exp((elo_a[i] - elo_h[i]) * _LN10_OVER_400))
+        return out
+except ImportError:  # numba is optional; the NumPy expression is the fallback
+    elo_win_prob = _elo_win_prob_np
+
+PREDICTION_COLS = ["matchup", "away_team", "home_team", "model_home_win%", "market_home_win%", "edge%"]
+
+def build_predictions_df(games, ratings_df, odds_map):
+    if not games:
+        return pd.DataFrame(columns=PREDICTION_COLS)
+    games_df = pd.DataFrame(games, columns=["away_team", "home_team"])
+    games_df = games_df.merge(
+        ratings_df.rename(columns={"team": "away_team", "elo": "elo_a"}), on="away_team", how="left"
+    ).merge(
+        ratings_df.rename(columns={"team": "home_team", "elo": "elo_h"}), on="home_team", how="left"
+    )
+    elo_a = games_df["elo_a"].fillna(1500.0).to_numpy(dtype=np.float64)
+    elo_h = games_df["elo_h"].fillna(1500.0).to_numpy(dtype=np.float64) + HOME_COURT_ELO
+    model_home = elo_win_prob(elo_a, elo_h)
+    games_df["matchup"] = games_df["away_team"] + " @ " + games_df["home_team"]
+    games_df["model_home_win%"] = (model_home * 100).round(1)
+    odds_df = pd.DataFrame.from_dict(odds_map, orient="index")
+    if not odds_df.empty:
+        odds_df = odds_df.rename_axis("matchup").reset_index()[["matchup", "market_home"]]
+        games_df = games_df.merge(odds_df, on="matchup", how="left")
+        games_df["market_home_win%"] = (games_df.pop("market_home") * 100).round(1)
+    else:
+        games_df["market_home_win%"] = float("nan")
+    games_df["edge%"] = (games_df["model_home_win%"] - games_df["market_home_win%"]).round(1)
+    return games_df[PREDICTION_COLS]
+
+def apply_fan_bias(ratings_df, team_name, boost_points):
+    if boost_points == 0:
+        # downstream is read-only, so the cached ratings frame can be shared as-is
+        return ratings_df
+    elo = ratings_df["elo"].to_numpy(copy=True)
+    elo[ratings_df["team"].to_numpy() == team_name] += boost_points
+    return ratings_df.assign(elo=elo)
+
+def filter_high_value_underdogs(preds_df, threshold_pct):
+    if preds_df.empty:
+        return preds_df
+    market = preds_df["market_home_win%"].to_numpy()
+    model = preds_df["model_home_win%"].to_numpy()
+    mask = (market < 50) & ((model - market) >= threshold_pct)
+    return preds_df.iloc[mask].sort_values("edge%", ascending=False, kind="stable")
 
 # -------------------
 # STREAMLIT APP
@@ -87,28 +281,25 @@ def current_results(results_df: pd.DataFrame):
 st.set_page_config(page_title="M-Rating Bracket Tracker", layout="wide")
 st.title("🏀 M-Rating Bracket Tracker & What‑If Simulator")
 
+# what-ifs live as {matchup_id: (winner_id, round)} — O(1) upsert per click,
+# materialized into a DataFrame only at the scoring boundary
 if "whatif_results" not in st.session_state:
-    st.session_state.whatif_results = pd.DataFrame(columns=["matchup_id", "winner_id", "round"])
+    st.session_state.whatif_results = {}
 
 # Sidebar mode toggle
 in_season = is_ncaa_in_season()
 default_mode = "Live" if in_season else "Snapshot"
 mode = st.sidebar.radio("Mode", options=["Live", "Snapshot"], index=0 if default_mode=="Live" else 1)
 
-# Load data
+# -------------------
+# SNAPSHOT MODE UI
+# -------------------
 if mode == "Snapshot":
     snap_path = get_latest_snapshot_path()
     meta, teams_df, bracket_df, odds_df, results_df = load_snapshot(snap_path)
     st.caption(f"📦 Off‑season mode: Selection Sunday snapshot {meta.get('snapshot_date', '')} (season {meta.get('season', '')})")
-else:
-    # Placeholder for live Odds API logic
-    meta, teams_df, bracket_df, odds_df, results_df = {}, pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
-    st.warning("Live mode placeholder — add Odds API fetch here.")
+    id_to_name = dict(zip(teams_df["team_id"], teams_df["team_name"])) if not teams_df.empty else {}
 
-# -------------------
-# SNAPSHOT MODE UI
-# -------------------
-if mode == "Snapshot":
     # What‑If Simulator FIRST
     st.subheader("🔄 What‑If Simulator")
     if not bracket_df.empty:
@@ -116,39 +307,57 @@ if mode == "Snapshot":
         sel_round = st.selectbox("Round", round_choices)
         subset = bracket_df[bracket_df["round"] == sel_round]
 
-        id_to_name = {r.team_id: r.team_name for _, r in teams_df.rename(columns=str).iterrows()}
-        def label(row):
-            t1 = id_to_name.get(row["team1_id"], row["team1_id"])
-            t2 = id_to_name.get(row["team2_id"], row["team2_id"])
-            return f'{row["matchup_id"]}: {t1} vs {t2}'
-
-        match = st.selectbox("Matchup", list(subset["matchup_id"]),
-                             format_func=lambda mid: label(subset[subset["matchup_id"]==mid].iloc[0]))
+        label_map = matchup_labels(subset, id_to_name)
+        match = st.selectbox("Matchup", list(subset["matchup_id"]), format_func=label_map.get)
         row = subset[subset["matchup_id"] == match].iloc[0]
         t1, t2 = row["team1_id"], row["team2_id"]
         winner = st.radio("Set winner", options=[t1, t2],
                           format_func=lambda tid: id_to_name.get(tid, tid), horizontal=True)
 
         if st.button("Apply What‑If"):
-            new_row = pd.DataFrame([{"matchup_id": match, "winner_id": winner, "round": int(row["round"])}])
-            if not st.session_state.whatif_results.empty and match in st.session_state.whatif_results["matchup_id"].values:
-                st.session_state.whatif_results.loc[
-                    st.session_state.whatif_results["matchup_id"] == match,
-                    ["winner_id", "round"]
-                ] = [winner, int(row["round"])]
-            else:
-                st.session_state.whatif_results = pd.concat(
-                    [st.session_state.whatif_results, new_row], ignore_index=True
-                )
+            st.session_state.whatif_results[match] = (winner, int(row["round"]))
             st.success("What‑If applied.")
 
     # Bracket Showdown SECOND
-    picks = snapshot_picks_to_brackets(bracket_df)
-    res = current_results(results_df)
-    leaderboard = score_brackets(picks, res)
+    overrides_tuple = tuple(sorted(
+        (mid, win, rnd) for mid, (win, rnd) in st.session_state.whatif_results.items()
+    ))
+    leaderboard = score_snapshot_brackets(snap_path, os.path.getmtime(snap_path), overrides_tuple)
     st.subheader("🏆 Bracket Showdown")
-    st.dataframe(leaderboard, hide_index=True)
+    st.dataframe(_for_display(leaderboard), hide_index=True)
 
     # Teams table LAST
     with st.expander("📋 Teams list"):
-        st.dataframe(teams_df, use_container_width=True)
+        st.dataframe(_for_display(teams_df), use_container_width=True)
+
+# -------------------
+# LIVE MODE UI
+# -------------------
+else:
+    api_key = os.environ.get("ODDS_API_KEY", "")
+    ratings_df = load_ratings()
+
+    st.sidebar.subheader("Live controls")
+    fan_team = st.sidebar.selectbox("Fan team", ["(none)"] + sorted(ratings_df["team"].tolist()))
+    fan_boost = st.sidebar.slider("Fan Elo boost", 0, 100, 0, 5)
+    edge_threshold = st.sidebar.slider("Underdog edge threshold (%)", 0.0, 20.0, 5.0, 0.5)
+
+    if not api_key:
+        st.warning("Live mode needs an ODDS_API_KEY environment variable.")
+    elif ratings_df.empty:
+        st.warning(f"No ratings found — expected {RATINGS_CSV} with team/elo columns.")
+    else:
+        odds_map = get_market_odds_ncaab(api_key)
+        games = get_todays_games(api_key)
+        biased = apply_fan_bias(ratings_df, fan_team, fan_boost)
+        preds_df = build_predictions_df(games, biased, odds_map)
+
+        st.subheader("📡 Today's model vs. market")
+        st.dataframe(_for_display(preds_df), hide_index=True, use_container_width=True)
+
+        st.subheader("💎 High-value underdogs")
+        dogs = filter_high_value_underdogs(preds_df, edge_threshold)
+        if dogs.empty:
+            st.info("No edges above the threshold right now.")
+        else:
+            st.dataframe(_for_display(dogs), hide_index=True, use_container_width=True)